@@ -16,18 +16,24 @@
 
 import os
 import logging
-import time
-import requests
 import re
+import signal
+import threading
 import firebase_admin
+from cachetools import TTLCache, cached
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from googleapiclient.discovery import build_from_document, build
+from discovery_services import SUPPORT_SVC, CRM_SVC, thread_http
+from googleapiclient.errors import HttpError
+from google.api_core.exceptions import GoogleAPICallError
 from firestore_write import firestore_write
-from get_firestore_cases import get_firestore_cases
+from firestore_batch import FirestoreBatch
+from get_firestore_cases_snapshot import get_firestore_cases_snapshot
 from get_firestore_first_in import get_firestore_first_in
 from firestore_delete_cases import firestore_delete_cases
-from notify_slack import notify_slack
-from support_case import SupportCase
+from slack_queue import SLACK_Q, drain_slack_queue, start_slack_worker
+from support_case import normalize_case
 from firebase_admin import credentials
 from firebase_admin import firestore
 from get_parent import get_parent
@@ -36,32 +42,62 @@ from support_add_comment import support_add_comment
 
 logger = logging.getLogger(__name__)
 MAX_RETRIES = 3
-
-
-def case_updates(is_test):
+# update_time given to cases that have closed but are pending deletion
+SENTINEL = "2100-12-31 23:59:59+00:00"
+# Poll interval, doubled for each consecutive loop without changes up to the max
+BASE_POLL = int(os.environ.get("POLL_INTERVAL_SECONDS", "10"))
+MAX_POLL = int(os.environ.get("MAX_POLL_SECONDS", "120"))
+# Upper bound on concurrent Firestore reads when checking asset subscriptions
+MAX_WORKERS = 8
+# Number of cases requested per page of search results
+PAGE_SIZE = 100
+# Project ancestry lookups are cached for an hour to pick up moves eventually
+ANCESTRY_CACHE_SIZE = 1024
+ANCESTRY_CACHE_TTL = 3600
+_PROJECT_RE = re.compile(r"projects/[^/]+")
+# Time allowed to post queued notifications on shutdown. Cloud Run gives 10
+# seconds between SIGTERM and SIGKILL
+SHUTDOWN_DRAIN_SECONDS = 8
+# Firestore allows at most 10 values in an "in" filter
+IN_QUERY_LIMIT = 10
+# Firestore client shared by the loop and its helpers, set once Firebase is up
+DB = None
+
+
+def case_updates(is_test, wake=None, stop=None):
     """
     Infinite loop that pulls all of the open Google Cloud support cases for our
-    org and their associated public comments every 15 seconds and compares it
-    to the cases and comments from the previous pull. If any change is detected
-    between the two versions of the case, the change is posted to any channel
-    that is tracking it.
+    org and their associated public comments every POLL_INTERVAL_SECONDS and
+    compares it to the cases and comments from the previous pull. If any change
+    is detected between the two versions of the case, the change is posted to
+    any channel that is tracking it. The interval backs off up to
+    MAX_POLL_SECONDS while no changes are detected.
 
     Parameters
     ----------
     is_test : bool
       flag indicating if we are running the loop a single time for testing
+    wake : Event
+      optional event that cuts the current wait short so the loop polls again
+      right away. Must be a multiprocessing.Event when set from another process
+    stop : Event
+      optional event that ends the loop at its next wait. SIGTERM sets it too
     """
     ORG_ID = os.environ.get("ORG_ID")
-    API_KEY = os.environ.get("API_KEY")
     # Must be double quotes for the query
     query_string = f'organization="organizations/{ORG_ID}" AND state=OPEN'
 
-    # Get our discovery doc and build our service
-    r = requests.get(
-        f"https://cloudsupport.googleapis.com/$discovery/rest?key={API_KEY}&labels=V2_TRUSTED_TESTER&version=v2beta",
-        timeout=5)
-    r.raise_for_status()
-    support_service = build_from_document(r.json())
+    support_service = SUPPORT_SVC
+    wake = wake or threading.Event()
+    stop = stop or threading.Event()
+
+    def handle_sigterm(signum, frame):
+        stop.set()
+        wake.set()
+
+    # Signal handlers can only be installed from the main thread
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, handle_sigterm)
 
     if not firebase_admin._apps:
         PROJECT_ID = os.environ.get("PROJECT_ID")
@@ -69,184 +105,395 @@ def case_updates(is_test):
         firebase_admin.initialize_app(cred, {
             "projectId": PROJECT_ID,
         })
+    global DB
+    if DB is None:
+        DB = firestore.client()
+    db = DB
+    start_slack_worker()
+    # Shared by every loop to overlap the per case comment and first in reads
+    executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    sleep_timer = BASE_POLL
+    consecutive_idle = 0
+    last_raw_cases = None
 
     while True:
-        loop_skip = False
-        sleep_timer = 10
         closed_cases = []
-        cases = get_firestore_cases()
-        req = support_service.cases().search(query=query_string)
+        new_cases = []
+        updated = False
+        pending_notifications = []
+        batch = FirestoreBatch(db)
         try:
-            resp = req.execute(num_retries=MAX_RETRIES).get("cases", [])
-        except BrokenPipeError as e:
+            raw_cases = list(search_cases(support_service, query_string))
+            # Every case with a new comment or other change has a new update
+            # time, so an identical search result means there's nothing to diff
+            unchanged = raw_cases == last_raw_cases
+            if not unchanged:
+                temp_cases = list(
+                    executor.map(normalize_case_threaded, raw_cases))
+        except (BrokenPipeError, NameError) as e:
             error_message = f"{e} : {datetime.now()}"
             logger.error(error_message)
-            time.sleep(5)
+            if pause(wake, stop, 5):
+                shutdown_drain()
+                break
             continue
-
-        temp_cases = []
-
-        for case in resp:
-            try:
-                temp_case = SupportCase(case)
-            except NameError as e:
-                error_message = f"{e} : {datetime.now()}"
-                logger.error(error_message)
-                loop_skip = True
+        except HttpError as e:
+            if e.resp.status != 429:
+                raise
+            error_message = f"{e} : {datetime.now()}"
+            logger.error(error_message)
+            retry_after = e.resp.get("retry-after", "")
+            if pause(wake, stop,
+                     int(retry_after) if retry_after.isdigit() else MAX_POLL):
+                shutdown_drain()
                 break
-            else:
-                temp_cases.append(vars(temp_case))
+            continue
 
-        if loop_skip:
-            time.sleep(5)
+        if unchanged:
+            sleep_timer, consecutive_idle = next_poll(False, consecutive_idle)
+            if pause(wake, stop, sleep_timer):
+                shutdown_drain()
+                break
             continue
 
+        cases = get_firestore_cases_snapshot()
+        fs_by_num = {c["case_number"]: c for c in cases}
+        tmp_by_num = {c["case_number"]: c for c in temp_cases}
+        prev_nums = fs_by_num.keys()
+        cur_nums = tmp_by_num.keys()
+
         # Check for cases that have closed since the last loop and notify slack
-        for fs_case in cases:
-            delete_entry = True
-            if fs_case["update_time"] == "2100-12-31 23:59:59+00:00":
-                delete_entry = False
-            else:
-                for t_case in temp_cases:
-                    if t_case["case_number"] == fs_case["case_number"]:
-                        delete_entry = False
-                        break
-            if delete_entry:
-                fs_case["update_time"] = "2100-12-31 23:59:59+00:00"
-                guid = firestore_write("cases", fs_case)
-                first_doc_in = get_firestore_first_in(fs_case["case_number"],
-                                                      fs_case["update_time"])
-                if first_doc_in:
-                    if guid == first_doc_in["guid"]:
-                        notify_slack(fs_case["case_number"], "closed", "")
-                        closed_cases.append(fs_case["case_number"])
+        for num in prev_nums - cur_nums:
+            fs_case = fs_by_num[num]
+            if fs_case["update_time"] != SENTINEL:
+                fs_case["update_time"] = SENTINEL
+                guid = firestore_write("cases", fs_case, batch, db)
+                pending_notifications.append((guid, fs_case, [("closed", "")]))
+
+        for num in cur_nums - prev_nums:
+            t_case = tmp_by_num[num]
+            firestore_write("cases", t_case, batch, db)
+            new_cases.append(t_case)
 
         # Check for existing cases that have a new update time. Post their relevant
         # update to the channels that are tracking those cases.
-        for t_case in temp_cases:
-            is_new = True
-            for fs_case in cases:
-                if t_case["case_number"] == fs_case["case_number"]:
-                    is_new = False
-                    if not t_case["update_time"] == fs_case["update_time"]:
-                        guid = firestore_write("cases", t_case)
-                        first_doc_in = get_firestore_first_in(
-                            t_case["case_number"], t_case["update_time"])
-                    if fs_case["comment_list"] != t_case["comment_list"]:
-                        if "googleSupport" in t_case["comment_list"][0][
-                                "creator"]:
-                            if guid == first_doc_in["guid"]:
-                                notify_slack(t_case["case_number"], "comment",
-                                             t_case["comment_list"][0]["body"])
-                    if fs_case["priority"] != t_case["priority"]:
-                        if guid == first_doc_in["guid"]:
-                            notify_slack(t_case["case_number"], "priority",
-                                         t_case["priority"])
-                    if fs_case["escalated"] != t_case["escalated"]:
-                        if t_case["escalated"]:
-                            if guid == first_doc_in["guid"]:
-                                notify_slack(t_case, "escalated",
-                                             t_case["escalated"])
-                        else:
-                            if guid == first_doc_in["guid"]:
-                                notify_slack(t_case["case_number"],
-                                             "de-escalated",
-                                             t_case["escalated"])
-
-            if is_new:
-                firestore_write("cases", t_case)
-                auto_cc(t_case)
+        for num in cur_nums & prev_nums:
+            t_case = tmp_by_num[num]
+            fs_case = fs_by_num[num]
+            if t_case["update_time"] == fs_case["update_time"]:
+                continue
+
+            guid = firestore_write("cases", t_case, batch, db)
+            updated = True
+            updates = []
+            if fs_case["comment_list"] != t_case["comment_list"]:
+                if t_case["comment_list"] and "googleSupport" in t_case[
+                        "comment_list"][0]["creator"]:
+                    updates.append(
+                        ("comment", t_case["comment_list"][0]["body"]))
+            if fs_case["priority"] != t_case["priority"]:
+                updates.append(("priority", t_case["priority"]))
+            if fs_case["escalated"] != t_case["escalated"]:
+                if t_case["escalated"]:
+                    updates.append(("escalated", t_case["escalated"]))
+                else:
+                    updates.append(("de-escalated", t_case["escalated"]))
+            # Only cases with something to post need the first in check
+            if updates:
+                pending_notifications.append((guid, t_case, updates))
+
+        # Commit every write from this loop at once. The writes must land before
+        # we can check which instance was first in or look up a case's parent
+        batch.commit()
+
+        lookups = [
+            executor.submit(get_firestore_first_in, case["case_number"],
+                            case["update_time"], db)
+            for _, case, _ in pending_notifications
+        ]
+        for (guid, case, updates), lookup in zip(pending_notifications,
+                                                 lookups):
+            num = case["case_number"]
+            first_doc_in = lookup.result()
+            if not first_doc_in or guid != first_doc_in["guid"]:
+                continue
+            SLACK_Q.put((num, updates))
+            if ("closed", "") in updates:
+                closed_cases.append(num)
+
+        for case in new_cases:
+            auto_cc(case, executor)
+
+        last_raw_cases = raw_cases
+        sleep_timer, consecutive_idle = next_poll(
+            updated or pending_notifications or new_cases, consecutive_idle)
 
         # Wait to try again so we don"t spam the API
-        time.sleep(sleep_timer)
+        stopping = pause(wake, stop, sleep_timer)
+        if stopping:
+            # This loop's notifications already won the first in check, so no
+            # other instance will send them. Post them before the process exits
+            shutdown_drain()
 
         # Delete closed cases after waiting to minimize duplicate Slack updates
         for case in closed_cases:
-            firestore_delete_cases(case)
+            firestore_delete_cases(case, batch, db)
+        batch.commit()
         if is_test:
+            SLACK_Q.join()
+        if is_test or stopping:
             break
 
+    executor.shutdown()
+
+
+def shutdown_drain():
+    # Give the Slack worker what's left of the grace period to catch up
+    if not drain_slack_queue(SHUTDOWN_DRAIN_SECONDS):
+        error_message = ("Shutting down with unsent Slack notifications :"
+                         f" {datetime.now()}")
+        logger.error(error_message)
+
+
+def pause(wake, stop, seconds) -> bool:
+    """
+    Waits for the given number of seconds, returning early if woken.
+
+    Parameters
+    ----------
+    wake : Event
+      event that ends the wait early when set. It is cleared before returning
+    stop : Event
+      event set when the loop should shut down
+    seconds : int
+      longest time to wait
+
+    Returns
+    -------
+    stopping
+      whether the loop should stop instead of polling again
+    """
+    wake.wait(seconds)
+    wake.clear()
+    return stop.is_set()
+
+
+def normalize_case_threaded(case):
+    # httplib2 isn't thread safe, so each worker sends with its own client
+    return normalize_case(case, thread_http())
+
+
+def next_poll(changed, consecutive_idle):
+    """
+    Backs off while nothing is changing and returns to the base interval as
+    soon as something does.
+
+    Parameters
+    ----------
+    changed : bool
+      whether the loop that just ran detected any case changes
+    consecutive_idle : int
+      number of loops in a row without changes, not counting this one
+
+    Returns
+    -------
+    sleep_timer
+      seconds to wait before the next loop
+    consecutive_idle
+      updated count of loops in a row without changes
+    """
+    if changed:
+        return BASE_POLL, 0
+    sleep_timer = min(MAX_POLL, BASE_POLL * 2**consecutive_idle)
+    if sleep_timer < MAX_POLL:
+        consecutive_idle += 1
+    return sleep_timer, consecutive_idle
+
+
+def search_cases(support_service, query_string):
+    """
+    Yields every case matching the query, requesting the next page of results
+    as each page is consumed.
+
+    Parameters
+    ----------
+    support_service : Resource
+      Cloud Support API service used to run the search
+    query_string : str
+      Cloud Support API search query for the cases
+    """
+    req = support_service.cases().search(query=query_string, pageSize=PAGE_SIZE)
+    while req is not None:
+        resp = req.execute(num_retries=MAX_RETRIES)
+        yield from resp.get("cases", [])
+        req = support_service.cases().search_next(previous_request=req,
+                                                  previous_response=resp)
+
 
-def auto_cc(case):
-    # Loop through all the Channel IDs and check which ones have the new case in
-    # their auto cc tracking
-    collection = "tracked_assets"
-    db = firestore.client()
-    tracked_assets = db.collection(collection).get()
+@cached(cache=TTLCache(maxsize=ANCESTRY_CACHE_SIZE, ttl=ANCESTRY_CACHE_TTL))
+def get_ancestry(project_id):
+    """
+    Walks up the resource hierarchy from a project. Results are cached since
+    projects rarely move, so a burst of new cases in one project only pays for
+    the lookup once.
+
+    Parameters
+    ----------
+    project_id : str
+      resource name of the project, e.g. projects/my-project
+
+    Returns
+    -------
+    folder_ids
+      ids of the folders between the project and the org, nearest first
+    org_id
+      id of the org the project belongs to
+    """
+    projects = CRM_SVC.projects()
+    folders = CRM_SVC.folders()
+    project_req = projects.get(name=project_id)
+    case_project = project_req.execute(num_retries=MAX_RETRIES)
+    parent = case_project["parent"]
+    parent_type, parent_id = parent.split('/')
+    folder_ids = []
+    while parent_type == "folders":
+        folder_ids.append(parent_id)
+        folder_req = folders.get(name=parent)
+        folder_resp = folder_req.execute(num_retries=MAX_RETRIES)
+        parent = folder_resp["parent"]
+        parent_type, parent_id = parent.split('/')
+
+    # 'parent' is either org due to no folders in between project & org
+    # or we've reached the top level folder in hierarchy after folder traversal
+    return folder_ids, parent_id
+
+
+def auto_cc(case, executor):
+    # Find every channel with an auto cc subscription on the new case's project
+    # or one of its ancestors
+    db = DB
     case_num = case["case_number"]
     case_parent = get_parent(case_num)
-    project_id = re.search("projects\/[^\/]+", case_parent).group()
+    project_id = _PROJECT_RE.search(case_parent).group()
+
+    try:
+        folder_ids, org_id = get_ancestry(project_id)
+    except BrokenPipeError as e:
+        error_message = f"{e} : {datetime.now()}"
+        logger.error(error_message)
+        return
+
+    project_id = project_id.split("/")[1]
+    asset_ids = (("organizations", [org_id]), ("folders", folder_ids),
+                 ("projects", [project_id]))
+
+    # The subscription lookups are independent reads, so overlap them. The CC
+    # list updates are read-modify-write on the same case and stay serial
+    lookups = [
+        executor.submit(find_tracked_assets, db, asset_type, ids)
+        for asset_type, ids in asset_ids
+    ]
+
+    # Group by channel, keeping the organization, folder, project order
+    subscriptions = defaultdict(list)
+    for lookup in lookups:
+        for item_dict in lookup.result():
+            subscriptions[item_dict["channel_id"]].append(item_dict)
+
+    for channel_id, items in subscriptions.items():
+        groups = [tracking_check(item_dict, case_num) for item_dict in items]
+        groups = [group for group in groups if group]
+        if not groups:
+            continue
 
-    with build("cloudresourcemanager", "v3") as service:
-        projects = service.projects()
-        folders = service.folders()
-        try:
-            project_req = projects.get(name=project_id)
-            case_project = project_req.execute(num_retries=MAX_RETRIES)
-            parent = case_project["parent"]
-            parent_type, parent_id = parent.split('/')
-            folder_ids = []
-            while parent_type == "folders":
-                folder_ids.append(parent_id)
-                folder_req = folders.get(name=parent)
-                folder_resp = folder_req.execute(num_retries=MAX_RETRIES)
-                parent = folder_resp["parent"]
-                parent_type, parent_id = parent.split('/')
-
-        except BrokenPipeError as e:
-            error_message = f"{e} : {datetime.now()}"
-            logger.error(error_message)
-            return
-
-        project_id = project_id.split("/")[1]
-        # 'parent' is either org due to no folders in between project & org
-        # or we've reached the top level folder in hierarchy after folder traversal
-        org_id = parent_id
-
-    for channel in tracked_assets:
-        channel_doc = db.document(f"{collection}/{channel.id}")
-
-        # Organization check
-        org_new_emails = tracking_check(channel_doc, "organizations", org_id,
-                                        case_num)
-        # Folder check
-        folder_new_emails = []
-        for folder in folder_ids:
-            folder_new_emails.extend(
-                tracking_check(channel_doc, "folders", folder, case_num))
-        # Project check
-        project_new_emails = tracking_check(channel_doc, "projects", project_id,
-                                            case_num)
-        combined_new_emails = []
-        for emails in (org_new_emails, folder_new_emails, project_new_emails):
-            joined = ", ".join(emails)
-            if joined:
-                combined_new_emails.append(joined)
-
-        if combined_new_emails:
-            response = (
-                "The following emails have been added automatically through"
-                f" asset subscription: {', '.join(combined_new_emails)}")
-
-            # Write a comment on the case to notify all newly added emails. Silence
-            # the Slack messages to avoid spam. Can leave user_id blank since we're
-            # silencing the Slack notifications
-            support_add_comment(channel.id, case_num, response, "",
-                                "Auto Asset Subscription", False)
-
-
-def tracking_check(channel, asset_type, asset_id, case_num):
-    asset = channel.collection(asset_type).get()
-    for item in asset:
-        item_dict = item.to_dict()
-
-        if item_dict["asset_id"] == asset_id:
-            # print(item_dict)
-            new_emails = support_subscribe_email(item_dict["channel_id"],
-                                                 case_num, item_dict["cc_list"],
-                                                 item_dict["user_id"])
-            return new_emails
-    return []
+        emails = ", ".join(email for group in groups for email in group)
+        response = ("The following emails have been added automatically through"
+                    f" asset subscription: {emails}")
+
+        # Write a comment on the case to notify all newly added emails. Silence
+        # the Slack messages to avoid spam. Can leave user_id blank since we're
+        # silencing the Slack notifications
+        support_add_comment(channel_id, case_num, response, "",
+                            "Auto Asset Subscription", False)
+
+
+def find_tracked_assets(db, asset_type, asset_ids):
+    """
+    Finds the subscriptions on any of the given assets across every channel
+    with one collection group query per IN_QUERY_LIMIT ids, instead of reading
+    each channel's subscriptions.
+
+    Parameters
+    ----------
+    db : firestore.Client
+      client used to run the queries
+    asset_type : str
+      the type of the assets. Must be of the following values: organizations,
+      folders, projects
+    asset_ids : str[]
+      unique ids of the resources to look up
+
+    Returns
+    -------
+    tracked_assets
+      list of dicts for the matching subscriptions
+    """
+    tracked_assets = []
+    try:
+        for i in range(0, len(asset_ids), IN_QUERY_LIMIT):
+            query = db.collection_group(asset_type).where(
+                "asset_id", "in", asset_ids[i:i + IN_QUERY_LIMIT])
+            for item in query.get():
+                # Skip any other collections that happen to share the name
+                if item.reference.path.startswith("tracked_assets/"):
+                    tracked_assets.append(item.to_dict())
+    except GoogleAPICallError as e:
+        # Most likely the collection group index on asset_id is missing
+        error_message = f"{e} : {datetime.now()}"
+        logger.error(error_message)
+        return scan_tracked_assets(db, asset_type, asset_ids)
+    return tracked_assets
+
+
+def scan_tracked_assets(db, asset_type, asset_ids):
+    """
+    Finds the subscriptions on any of the given assets by reading each
+    channel's subscriptions. Slower than find_tracked_assets, but needs no
+    collection group index.
+
+    Parameters
+    ----------
+    db : firestore.Client
+      client used to read the subscriptions
+    asset_type : str
+      the type of the assets. Must be of the following values: organizations,
+      folders, projects
+    asset_ids : str[]
+      unique ids of the resources to look up
+
+    Returns
+    -------
+    tracked_assets
+      list of dicts for the matching subscriptions
+    """
+    tracked_assets = []
+    for channel in db.collection("tracked_assets").get():
+        channel_doc = db.document(f"tracked_assets/{channel.id}")
+        for item in channel_doc.collection(asset_type).get():
+            item_dict = item.to_dict()
+            if item_dict["asset_id"] in asset_ids:
+                tracked_assets.append(item_dict)
+    return tracked_assets
+
+
+def tracking_check(item_dict, case_num):
+    # Always hand back a list of the newly added emails, empty if none
+    if item_dict is None:
+        return []
+    new_emails = support_subscribe_email(item_dict["channel_id"], case_num,
+                                         item_dict["cc_list"],
+                                         item_dict["user_id"])
+    return list(new_emails or [])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 Google LLC
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import logging
+import tempfile
+import threading
+import time
+import google.auth
+import httplib2
+import requests
+from datetime import datetime
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build_from_document
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+API_KEY = os.environ.get("API_KEY")
+# Reuse discovery docs cached on disk for up to a day
+DISCOVERY_CACHE_TTL = 86400
+DISCOVERY_CACHE_DIR = tempfile.gettempdir()
+SUPPORT_DISCOVERY_URL = (
+    "https://cloudsupport.googleapis.com/$discovery/rest"
+    f"?key={API_KEY}&labels=V2_TRUSTED_TESTER&version=v2beta")
+CRM_DISCOVERY_URL = (
+    "https://cloudresourcemanager.googleapis.com/$discovery/rest?version=v3")
+HTTP_TIMEOUT = 60
+SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
+
+# Reuse connections for discovery fetches instead of a new handshake each time
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+_local = threading.local()
+
+
+def get_discovery_doc(name, url) -> dict:
+    """
+    Returns the discovery doc for an API, using the copy cached on disk if it
+    is less than DISCOVERY_CACHE_TTL seconds old.
+
+    Parameters
+    ----------
+    name : str
+      short name of the API, used to name the cache file
+    url : str
+      url that the discovery doc is fetched from on a cache miss
+
+    Returns
+    -------
+    discovery_doc
+      the parsed discovery doc
+    """
+    path = os.path.join(DISCOVERY_CACHE_DIR, f"disc_{name}.json")
+    try:
+        if time.time() - os.path.getmtime(path) < DISCOVERY_CACHE_TTL:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        error_message = f"{e} : {datetime.now()}"
+        logger.warning(error_message)
+
+    r = _session.get(url, timeout=5)
+    r.raise_for_status()
+    discovery_doc = r.json()
+
+    # Write to a temp file first so another process never reads a partial doc
+    try:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(discovery_doc, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        error_message = f"{e} : {datetime.now()}"
+        logger.warning(error_message)
+
+    return discovery_doc
+
+
+def authorized_http() -> AuthorizedHttp:
+    """
+    Returns an authorized httplib2 client with its own connection pool. The
+    service built on it keeps its connections open across requests. httplib2
+    isn't thread safe, so each service gets its own.
+
+    Returns
+    -------
+    http
+      httplib2 client that attaches the application default credentials
+    """
+    creds, _ = google.auth.default(scopes=SCOPES)
+    return AuthorizedHttp(creds, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+
+
+def thread_http() -> AuthorizedHttp:
+    """
+    Returns an authorized httplib2 client for the calling thread, creating it
+    on first use. Worker threads pass it to execute() so that requests made on
+    the shared services never share a connection across threads.
+
+    Returns
+    -------
+    http
+      httplib2 client owned by the calling thread
+    """
+    if not hasattr(_local, "http"):
+        _local.http = authorized_http()
+    return _local.http
+
+
+SUPPORT_SVC = build_from_document(get_discovery_doc("cloudsupport",
+                                                    SUPPORT_DISCOVERY_URL),
+                                  http=authorized_http())
+CRM_SVC = build_from_document(get_discovery_doc("cloudresourcemanager",
+                                                CRM_DISCOVERY_URL),
+                              http=authorized_http())
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 Google LLC
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+
+logger = logging.getLogger(__name__)
+# Firestore rejects batches with more than 500 writes
+MAX_BATCH_WRITES = 500
+
+
+class FirestoreBatch:
+    """
+    Accumulate Firestore sets and deletes and commit them together, starting a
+    new batch whenever the current one reaches the Firestore write limit.
+
+    Attributes
+    ----------
+    db : firestore.Client
+      client used to create the underlying write batches
+    """
+
+    def __init__(self, db):
+        """
+        Parameters
+        ----------
+        db : firestore.Client
+            client used to create the underlying write batches
+        """
+        self.db = db
+        self._batch = db.batch()
+        self._count = 0
+
+    def set(self, doc_ref, content):
+        """
+        Queue a write of content to the given document.
+
+        Parameters
+        ----------
+        doc_ref : DocumentReference
+            document that we are writing
+        content : dict
+            json data that we are writing
+        """
+        self._batch.set(doc_ref, content)
+        self._queued()
+
+    def delete(self, doc_ref):
+        """
+        Queue a delete of the given document.
+
+        Parameters
+        ----------
+        doc_ref : DocumentReference
+            document that we are deleting
+        """
+        self._batch.delete(doc_ref)
+        self._queued()
+
+    def commit(self):
+        """
+        Commit any queued writes that haven't been sent yet.
+        """
+        if self._count:
+            self._batch.commit()
+            self._batch = self.db.batch()
+            self._count = 0
+
+    def _queued(self):
+        self._count += 1
+        if self._count >= MAX_BATCH_WRITES:
+            self.commit()
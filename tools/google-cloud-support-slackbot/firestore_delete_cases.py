@@ -23,7 +23,7 @@ from firebase_admin import firestore
 logger = logging.getLogger(__name__)
 
 
-def firestore_delete_cases(case):
+def firestore_delete_cases(case, batch=None, db=None):
     """
     Delete all cases from Firestore with a matching case number.
 
@@ -31,23 +31,32 @@ def firestore_delete_cases(case):
     ----------
     case : str
       unique id of the case
+    batch : FirestoreBatch
+      optional batch to queue the deletes on instead of deleting immediately
+    db : firestore.Client
+      optional client to reuse instead of looking one up
     """
-    # Initialize the Firebase app if it hasn"t already been done
-    if not firebase_admin._apps:
-        PROJECT_ID = os.environ.get("PROJECT_ID")
-        cred = credentials.ApplicationDefault()
-        firebase_admin.initialize_app(cred, {
-            "projectId": PROJECT_ID,
-        })
+    if db is None:
+        # Initialize the Firebase app if it hasn"t already been done
+        if not firebase_admin._apps:
+            PROJECT_ID = os.environ.get("PROJECT_ID")
+            cred = credentials.ApplicationDefault()
+            firebase_admin.initialize_app(cred, {
+                "projectId": PROJECT_ID,
+            })
+        db = firestore.client()
 
     collection = "cases"
-    db = firestore.client()
     firestore_cases = db.collection(collection).where("case_number", "==",
                                                       case).get()
 
     for firestore_case in firestore_cases:
         fs_case = firestore_case.to_dict()
-        db.collection(collection).document(fs_case["guid"]).delete()
+        doc_ref = db.collection(collection).document(fs_case["guid"])
+        if batch is None:
+            doc_ref.delete()
+        else:
+            batch.delete(doc_ref)
 
 
 if __name__ == "__main__":
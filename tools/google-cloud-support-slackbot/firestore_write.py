@@ -25,7 +25,7 @@ from firebase_admin import firestore
 logger = logging.getLogger(__name__)
 
 
-def firestore_write(collection, content) -> str:
+def firestore_write(collection, content, batch=None, db=None) -> str:
     """
     Takes the provided json and attaches a guid and timestamp to it and then
     writes it to the specified collection.
@@ -36,6 +36,11 @@ def firestore_write(collection, content) -> str:
       name of the collection that we are writing to
     content : dict
       json data that we are writing
+    batch : FirestoreBatch
+      optional batch to queue the write on instead of writing immediately. The
+      write is not visible until the batch is committed
+    db : firestore.Client
+      optional client to reuse instead of looking one up
 
     Returns
     -------
@@ -43,22 +48,26 @@ def firestore_write(collection, content) -> str:
       unique string that is used by the firestore_read module to determine if
       this instance was the first to write the data into Firestore
     """
-    # Initialize the Firebase app if it hasn"t already been done
-    if not firebase_admin._apps:
-        PROJECT_ID = os.environ.get("PROJECT_ID")
-        cred = credentials.ApplicationDefault()
-        firebase_admin.initialize_app(cred, {
-            "projectId": PROJECT_ID,
-        })
+    if db is None:
+        # Initialize the Firebase app if it hasn"t already been done
+        if not firebase_admin._apps:
+            PROJECT_ID = os.environ.get("PROJECT_ID")
+            cred = credentials.ApplicationDefault()
+            firebase_admin.initialize_app(cred, {
+                "projectId": PROJECT_ID,
+            })
+        db = firestore.client()
 
-    db = firestore.client()
     guid = str(uuid.uuid4())
     timestamp = time.time()
     content["guid"] = guid
     content["firestore_timestamp"] = timestamp
 
     doc_ref = db.collection(collection).document(guid)
-    doc_ref.set(content)
+    if batch is None:
+        doc_ref.set(content)
+    else:
+        batch.set(doc_ref, content)
 
     return guid
 
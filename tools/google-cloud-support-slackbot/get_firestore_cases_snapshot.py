@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 Google LLC
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import logging
+import threading
+import firebase_admin
+from datetime import datetime
+from firebase_admin import credentials
+from firebase_admin import firestore
+from get_firestore_cases import get_firestore_cases
+
+logger = logging.getLogger(__name__)
+# Seconds to wait for the listener to deliver its initial snapshot
+INITIAL_SNAPSHOT_TIMEOUT = 30
+
+_lock = threading.Lock()
+_ready = threading.Event()
+_docs = {}
+_watch = None
+
+
+def _on_snapshot(col_snapshot, changes, read_time):
+    """
+    Applies the document changes delivered by the Firestore listener to our
+    in-memory copy of the cases collection.
+    """
+    with _lock:
+        for change in changes:
+            if change.type.name == "REMOVED":
+                _docs.pop(change.document.id, None)
+            else:
+                _docs[change.document.id] = change.document.to_dict()
+    _ready.set()
+
+
+def get_firestore_cases_snapshot() -> list:
+    """
+    Returns the copy for each case id with the greatest timestamp value, the
+    same as get_firestore_cases, but served from a long-lived listener on the
+    cases collection. After the initial snapshot only changed documents are
+    read from Firestore.
+
+    Returns
+    -------
+    support_cases
+        list of dicts containing the case information for all of our cases
+    """
+    global _watch
+
+    # The watch stream stops for good on a non-recoverable error. Drop the
+    # frozen copy and listen again rather than diffing against stale cases
+    if _watch is not None and not _watch.is_active:
+        error_message = ("The Firestore cases listener stopped, resubscribing :"
+                         f" {datetime.now()}")
+        logger.error(error_message)
+        _watch.unsubscribe()
+        _watch = None
+        with _lock:
+            _ready.clear()
+            _docs.clear()
+
+    if _watch is None:
+        # Initialize the Firebase app if it hasn"t already been done
+        if not firebase_admin._apps:
+            PROJECT_ID = os.environ.get("PROJECT_ID")
+            cred = credentials.ApplicationDefault()
+            firebase_admin.initialize_app(cred, {
+                "projectId": PROJECT_ID,
+            })
+
+        db = firestore.client()
+        _watch = db.collection("cases").on_snapshot(_on_snapshot)
+
+    # Fall back to a full read rather than reporting every case as new
+    if not _ready.wait(INITIAL_SNAPSHOT_TIMEOUT):
+        error_message = ("Timed out waiting for the Firestore cases listener :"
+                         f" {datetime.now()}")
+        logger.error(error_message)
+        return get_firestore_cases()
+
+    with _lock:
+        fs_cases = [dict(fs_case) for fs_case in _docs.values()]
+
+    latest = {}
+    for fs_case in fs_cases:
+        case_number = fs_case["case_number"]
+        if case_number not in latest or float(
+                fs_case["firestore_timestamp"]) > float(
+                    latest[case_number]["firestore_timestamp"]):
+            latest[case_number] = fs_case
+
+    return list(latest.values())
+
+
+if __name__ == "__main__":
+    print(str(get_firestore_cases_snapshot()))
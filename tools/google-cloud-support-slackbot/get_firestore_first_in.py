@@ -24,7 +24,7 @@ from datetime import datetime
 logger = logging.getLogger(__name__)
 
 
-def get_firestore_first_in(case, update_time) -> dict:
+def get_firestore_first_in(case, update_time, db=None) -> dict:
     """
     Pulls all the docs for a case with the specified update time and returns the
     the doc with the earliest app-generated timestamp.
@@ -35,21 +35,23 @@ def get_firestore_first_in(case, update_time) -> dict:
         a unique string of numbers that is the id for the case
     update_time : str
         the reported time that the case was last updated
+    db : firestore.Client
+        optional client to reuse instead of looking one up
 
     Returns
     -------
     first_doc_in
         the matching document in the collection with the earliest timestamp
     """
-    # Initialize the Firebase app if it hasn"t already been done
-    if not firebase_admin._apps:
-        PROJECT_ID = os.environ.get("PROJECT_ID")
-        cred = credentials.ApplicationDefault()
-        firebase_admin.initialize_app(cred, {
-            "projectId": PROJECT_ID,
-        })
-
-    db = firestore.client()
+    if db is None:
+        # Initialize the Firebase app if it hasn"t already been done
+        if not firebase_admin._apps:
+            PROJECT_ID = os.environ.get("PROJECT_ID")
+            cred = credentials.ApplicationDefault()
+            firebase_admin.initialize_app(cred, {
+                "projectId": PROJECT_ID,
+            })
+        db = firestore.client()
 
     collection_ref = db.collection("cases")
 
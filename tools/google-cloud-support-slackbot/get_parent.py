@@ -17,10 +17,13 @@
 import os
 import logging
 import firebase_admin
+from cachetools import TTLCache
 from firebase_admin import credentials
 from firebase_admin import firestore
 
 logger = logging.getLogger(__name__)
+# A case's parent never changes, the TTL only bounds how long memory is held
+_parents = TTLCache(maxsize=1024, ttl=3600)
 
 
 def get_parent(case) -> str:
@@ -32,6 +35,10 @@ def get_parent(case) -> str:
     case : str
       unique id of the case
     """
+    parent = _parents.get(case)
+    if parent is not None:
+        return parent
+
     # Initialize the Firebase app if it hasn"t already been done
     if not firebase_admin._apps:
         PROJECT_ID = os.environ.get("PROJECT_ID")
@@ -46,7 +53,9 @@ def get_parent(case) -> str:
                                                       case).get()
 
     if firestore_cases:
-        return firestore_cases[0].to_dict()["resource_name"]
+        parent = firestore_cases[0].to_dict()["resource_name"]
+        _parents[case] = parent
+        return parent
     else:
         return "Case not found"
 
@@ -18,6 +18,8 @@ import slack
 import os
 import requests
 import multiprocessing as mp
+import signal
+import gevent
 from flask import Flask, request, Response
 from slackeventsapi import SlackEventAdapter
 from googleapiclient.discovery import build_from_document
@@ -69,6 +71,12 @@ support_service = build_from_document(r.json())
 
 tracked_cases = get_firestore_tracked_cases()
 
+# Shared with the case_updates process. Setting case_updates_wake makes it poll
+# again right away and case_updates_stop ends its loop. Created under __main__
+# since the spawn start method has to be set first
+case_updates_wake = None
+case_updates_stop = None
+
 
 # Handle all calls to the support bot
 @app.route("/", methods=["POST"])
@@ -347,10 +355,54 @@ def gcp_support() -> Response:
     return Response(), 200
 
 
+@app.route("/poke", methods=["POST"])
+def poke() -> Response:
+    """
+    Tells the case_updates loop to poll for case changes now instead of
+    waiting out its current interval.
+
+    Parameters
+    ----------
+    request : Request
+      request that was submitted by Slack
+    Returns
+    -------
+    200
+      HTTP 200 OK
+    403
+      HTTP 403 Forbidden, received if the request signature can"t be verified
+    """
+    slack_timestamp = request.headers.get("X-Slack-Request-Timestamp")
+    slack_signature = request.headers.get("X-Slack-Signature")
+    result = slack_events.server.verify_signature(slack_timestamp,
+                                                  slack_signature)
+    if result is False:
+        return Response(), 403
+
+    if case_updates_wake is not None:
+        case_updates_wake.set()
+    return Response(), 200
+
+
+def shutdown():
+    """
+    Stops case_updates at its next wait and stops accepting requests so the
+    container can exit within its termination grace period.
+    """
+    case_updates_stop.set()
+    case_updates_wake.set()
+    http_server.stop()
+
+
 if __name__ == "__main__":
     mp.set_start_method("spawn")
-    case_updates_process = mp.Process(target=case_updates, args=(False,))
+    case_updates_wake = mp.Event()
+    case_updates_stop = mp.Event()
+    case_updates_process = mp.Process(target=case_updates,
+                                      args=(False, case_updates_wake,
+                                            case_updates_stop))
     case_updates_process.start()
     http_server = WSGIServer(("", 5000), app)
+    gevent.signal_handler(signal.SIGTERM, shutdown)
     http_server.serve_forever()
     case_updates_process.join()
@@ -20,9 +20,65 @@ import logging
 from get_firestore_tracked_cases import get_firestore_tracked_cases
 
 logger = logging.getLogger(__name__)
+# Slack rejects section blocks with more than 3000 characters of text
+MAX_BLOCK_TEXT = 3000
 
 
-def notify_slack(case, update_type, update_text):
+def update_message(case, update_type, update_text) -> str:
+    """
+    Builds the Slack message for a single case update.
+
+    Parameters
+    ----------
+    case : str
+        unique id of the case
+    update_type : str
+        specifies what was changed in the case
+    update_text : str
+        update relevant content that is injected into the Slack message
+
+    Returns
+    -------
+    message
+        text of the message, or an empty string for unknown update types
+    """
+    if update_type == "comment":
+        return ("You have an update from your support engineer on case"
+                f" {case}: \n{update_text}")
+    elif update_type == "priority":
+        return (f"The priority of case {case} has been changed"
+                f" to {update_text}")
+    elif update_type == "closed":
+        return f"Case {case} has been closed"
+    elif update_type == "escalated":
+        return f"Case {case} has been escalated"
+    elif update_type == "de-escalated":
+        return f"Case {case} has been de-escalated"
+    return ""
+
+
+def truncate_block_text(message) -> str:
+    """
+    Shortens a message to fit in a section block. The full message is still
+    sent in the text fallback.
+
+    Parameters
+    ----------
+    message : str
+        text of the message
+
+    Returns
+    -------
+    message
+        the message, cut to MAX_BLOCK_TEXT characters with an ellipsis if it
+        was longer
+    """
+    if len(message) <= MAX_BLOCK_TEXT:
+        return message
+    return message[:MAX_BLOCK_TEXT - 3] + "..."
+
+
+def notify_slack(case, update_type, update_text, throttle=None):
     """
     Sends update messages to Slack.
 
@@ -34,31 +90,54 @@ def notify_slack(case, update_type, update_text):
         specifies what was changed in the case
     update_text : str
         update relevant content that is injected into the Slack message
+    throttle : function
+        optional function called with each channel_id before posting to it,
+        used to rate limit the messages sent to a channel
+    """
+    notify_slack_updates(case, [(update_type, update_text)], throttle)
+
+
+def notify_slack_updates(case, updates, throttle=None):
     """
+    Sends all of a case's updates to Slack as a single message per channel,
+    with one section block per update.
+
+    Parameters
+    ----------
+    case : str
+        unique id of the case
+    updates : list
+        (update_type, update_text) tuples for each change in the case
+    throttle : function
+        optional function called with each channel_id before posting to it,
+        used to rate limit the messages sent to a channel
+    """
+    messages = [
+        message for message in (update_message(case, update_type, update_text)
+                                for update_type, update_text in updates)
+        if message
+    ]
+    if not messages:
+        return
+
+    # The text doubles as the notification fallback for the blocks
+    message_args = {"text": "\n\n".join(messages)}
+    if len(messages) > 1:
+        message_args["blocks"] = [{
+            "type": "section",
+            "text": {
+                "type": "mrkdwn",
+                "text": truncate_block_text(message)
+            }
+        } for message in messages]
+
     client = slack.WebClient(token=os.environ.get("SLACK_TOKEN"))
     tracked_cases = get_firestore_tracked_cases()
     for t in tracked_cases:
         if t["case"] == case:
-            if update_type == "comment":
-                client.chat_postMessage(
-                    channel=t["channel_id"],
-                    text="You have an update from your support engineer on case"
-                    f" {case}: \n{update_text}")
-            elif update_type == "priority":
-                client.chat_postMessage(
-                    channel=t["channel_id"],
-                    text=(f"The priority of case {case} has been changed"
-                          f" to {update_text}"))
-            elif update_type == "closed":
-                client.chat_postMessage(channel=t["channel_id"],
-                                        text=f"Case {case} has been closed")
-            elif update_type == "escalated":
-                client.chat_postMessage(channel=t["channel_id"],
-                                        text=f"Case {case} has been escalated")
-            elif update_type == "de-escalated":
-                client.chat_postMessage(
-                    channel=t["channel_id"],
-                    text=f"Case {case} has been de-escalated")
+            if throttle is not None:
+                throttle(t["channel_id"])
+            client.chat_postMessage(channel=t["channel_id"], **message_args)
 
 
 if __name__ == "__main__":
@@ -77,3 +156,4 @@ if __name__ == "__main__":
     notify_slack(test_case, test_update_type, test_update_text)
     test_update_type = "de-escalated"
     notify_slack(test_case, test_update_type, test_update_text)
+    notify_slack_updates(test_case, [("priority", "P2"), ("escalated", "")])
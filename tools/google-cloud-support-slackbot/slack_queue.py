@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+# Copyright 2023 Google LLC
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import queue
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+from notify_slack import notify_slack_updates
+
+logger = logging.getLogger(__name__)
+# At most SLACK_RATE_LIMIT messages per channel every SLACK_RATE_WINDOW seconds
+SLACK_RATE_LIMIT = 1
+SLACK_RATE_WINDOW = 1.0
+
+SLACK_Q = queue.Queue()
+_sent = defaultdict(deque)
+_worker = None
+
+
+def throttle_channel(channel_id):
+    """
+    Blocks until another message can be posted to the channel without going
+    over the per channel rate limit. Only called from the worker thread.
+
+    Parameters
+    ----------
+    channel_id : str
+        unique string used to idenify a Slack channel
+    """
+    sent = _sent[channel_id]
+    now = time.monotonic()
+    while sent and now - sent[0] >= SLACK_RATE_WINDOW:
+        sent.popleft()
+    if len(sent) >= SLACK_RATE_LIMIT:
+        time.sleep(SLACK_RATE_WINDOW - (now - sent[0]))
+        sent.popleft()
+    sent.append(time.monotonic())
+
+
+def slack_worker():
+    """
+    Posts the notifications put on SLACK_Q, one at a time. Each item is a
+    (case, updates) pair for notify_slack_updates, so all of a case's updates
+    from one loop go out as a single message.
+    """
+    while True:
+        case, updates = SLACK_Q.get()
+        try:
+            notify_slack_updates(case, updates, throttle_channel)
+        except Exception as e:
+            # Keep the worker alive so one failed post doesn't drop the rest
+            error_message = f"{e} : {datetime.now()}"
+            logger.error(error_message)
+        finally:
+            SLACK_Q.task_done()
+
+
+def drain_slack_queue(timeout) -> bool:
+    """
+    Waits for the worker to post everything put on SLACK_Q so far, like
+    SLACK_Q.join() but giving up after the timeout.
+
+    Parameters
+    ----------
+    timeout : float
+        longest time to wait, in seconds
+
+    Returns
+    -------
+    drained
+        whether every queued notification was posted in time
+    """
+    deadline = time.monotonic() + timeout
+    with SLACK_Q.all_tasks_done:
+        while SLACK_Q.unfinished_tasks:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            SLACK_Q.all_tasks_done.wait(remaining)
+    return True
+
+
+def start_slack_worker():
+    """
+    Starts the background thread that drains SLACK_Q if it isn't running yet.
+    """
+    global _worker
+
+    if _worker is None:
+        _worker = threading.Thread(target=slack_worker, daemon=True)
+        _worker.start()
+
+
+if __name__ == "__main__":
+    test_case = os.environ.get("TEST_CASE")
+    start_slack_worker()
+    SLACK_Q.put((test_case, [("priority", "Priority unchanged")]))
+    SLACK_Q.put((test_case, [("priority", "P2"), ("escalated", "")]))
+    SLACK_Q.join()
@@ -26,7 +26,7 @@ from get_parent import get_parent
 from case_details import case_details
 from track_case import track_case
 from get_firestore_tracked_cases import get_firestore_tracked_cases
-from notify_slack import notify_slack
+from notify_slack import notify_slack, notify_slack_updates
 from list_tracked_cases import list_tracked_cases
 from list_tracked_cases_all import list_tracked_cases_all
 from sitrep import sitrep
@@ -295,6 +295,15 @@ class MonolithicTestCase(unittest.TestCase):
                                                        update_text)
         self.assertEqual(notify_slack_deescalated_output, None)
 
+    def step16a_notify_slack_updates(self):
+        """
+        Run the notify_slack_updates procedure for several updates at once. If
+        successful, a single message will appear in Slack.
+    """
+        updates = [("priority", "P5"), ("escalated", "")]
+        notify_slack_updates_output = notify_slack_updates(self.case, updates)
+        self.assertEqual(notify_slack_updates_output, None)
+
     def step17_list_tracked_cases(self):
         """
         Run the list_tracked_cases procedure. If successful, a message will
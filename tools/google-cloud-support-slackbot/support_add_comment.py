@@ -16,12 +16,11 @@
 
 import os
 import slack
-import requests
 import logging
 from datetime import datetime
 from get_parent import get_parent
 from case_not_found import case_not_found
-from googleapiclient.discovery import build_from_document
+from discovery_services import SUPPORT_SVC
 
 logger = logging.getLogger(__name__)
 
@@ -54,15 +53,9 @@ def support_add_comment(channel_id,
     allow_alerts : bool
       flag to determine whether to silent Slack ephemeral message
     """
-    API_KEY = os.environ.get("API_KEY")
     MAX_RETRIES = 3
 
-    # Get our discovery doc and build our service
-    r = requests.get(
-        f"https://cloudsupport.googleapis.com/$discovery/rest?key={API_KEY}&labels=V2_TRUSTED_TESTER&version=v2beta",
-        timeout=5)
-    r.raise_for_status()
-    support_service = build_from_document(r.json())
+    support_service = SUPPORT_SVC
 
     client = slack.WebClient(token=os.environ.get("SLACK_TOKEN"))
 
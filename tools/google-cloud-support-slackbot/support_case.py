@@ -14,15 +14,90 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import os
 import re
 import logging
 import time
-import requests
 from datetime import datetime
-from googleapiclient.discovery import build_from_document
+from discovery_services import SUPPORT_SVC
 
 logger = logging.getLogger(__name__)
+_CASE_NUMBER_RE = re.compile(r"(?:cases/)([0-9]+)")
+
+
+def normalize_case(caseobj, http=None) -> dict:
+    """
+    Projects the fields we track out of a Cloud Support API case and pulls its
+    public comments. The keys match the SupportCase attributes.
+
+    Parameters
+    ----------
+    caseobj : json
+        json for an individual case
+    http : AuthorizedHttp
+        optional client to send the comment requests with, required when
+        normalizing cases from more than one thread
+
+    Returns
+    -------
+    case
+        dict containing the case information
+
+    Raises
+    ------
+    NameError
+        if the case number can't be parsed from the case's resource name
+    """
+    MAX_RETRIES = 3
+    support_service = SUPPORT_SVC
+
+    resource_name = caseobj["name"]
+    case_number = _CASE_NUMBER_RE.search(resource_name)
+    if case_number is None:
+        raise NameError(f"No case number found in {resource_name}")
+
+    comment_list = []
+    case_comments = support_service.cases().comments()
+    request = case_comments.list(parent=resource_name)
+    while request is not None:
+        try:
+            comments = request.execute(http=http, num_retries=MAX_RETRIES)
+        except BrokenPipeError as e:
+            error_message = f"{e} : {datetime.now()}"
+            logger.error(error_message)
+            time.sleep(1)
+        else:
+            if "comments" in comments:
+                comment_list.extend(comments["comments"])
+            request = case_comments.list_next(request, comments)
+
+    return {
+        "case_number":
+            case_number[1],
+        "resource_name":
+            resource_name,
+        "case_title":
+            caseobj["displayName"],
+        "description":
+            caseobj["description"],
+        "escalated":
+            caseobj.get("escalated", False),
+        "case_creator":
+            caseobj["creator"]["displayName"],
+        "create_time":
+            str(
+                datetime.fromisoformat(caseobj["createTime"].replace(
+                    "Z", "+00:00"))),
+        "update_time":
+            str(
+                datetime.fromisoformat(caseobj["updateTime"].replace(
+                    "Z", "+00:00"))),
+        "priority":
+            caseobj["severity"].replace("S", "P"),
+        "state":
+            caseobj["state"],
+        "comment_list":
+            comment_list,
+    }
 
 
 class SupportCase:
@@ -68,45 +143,4 @@ class SupportCase:
         caseobj : json
             json for an individual case
         """
-        MAX_RETRIES = 3
-        API_KEY = os.environ.get("API_KEY")
-
-        # Get our discovery doc and build our service
-        r = requests.get(
-            f"https://cloudsupport.googleapis.com/$discovery/rest?key={API_KEY}&labels=V2_TRUSTED_TESTER&version=v2beta",
-            timeout=5)
-        r.raise_for_status()
-        support_service = build_from_document(r.json())
-
-        self.case_number = re.search("(?:cases/)([0-9]+)", caseobj["name"])[1]
-        self.resource_name = caseobj["name"]
-        self.case_title = caseobj["displayName"]
-        self.description = caseobj["description"]
-        if "escalated" in caseobj:
-            self.escalated = caseobj["escalated"]
-        else:
-            self.escalated = False
-        self.case_creator = caseobj["creator"]["displayName"]
-        self.create_time = str(
-            datetime.fromisoformat(caseobj["createTime"].replace("Z",
-                                                                 "+00:00")))
-        self.update_time = str(
-            datetime.fromisoformat(caseobj["updateTime"].replace("Z",
-                                                                 "+00:00")))
-        self.priority = caseobj["severity"].replace("S", "P")
-        self.state = caseobj["state"]
-        self.comment_list = []
-        case_comments = support_service.cases().comments()
-        request = case_comments.list(parent=self.resource_name)
-        while request is not None:
-            try:
-                comments = request.execute(num_retries=MAX_RETRIES)
-            except BrokenPipeError as e:
-                error_message = f"{e} : {datetime.now()}"
-                logger.error(error_message)
-                time.sleep(1)
-            else:
-                if "comments" in comments:
-                    for comment in comments["comments"]:
-                        self.comment_list.append(comment)
-                request = case_comments.list_next(request, comments)
+        vars(self).update(normalize_case(caseobj))
@@ -16,12 +16,11 @@
 
 import os
 import slack
-import requests
 import logging
 from datetime import datetime
 from get_firestore_cases import get_firestore_cases
 from case_not_found import case_not_found
-from googleapiclient.discovery import build_from_document
+from discovery_services import SUPPORT_SVC
 from googleapiclient.errors import HttpError
 
 logger = logging.getLogger(__name__)
@@ -50,15 +49,9 @@ def support_subscribe_email(channel_id, case, emails, user_id):
         a list of unique emails that have been newly added to the Google
         Cloud Support case
     """
-    API_KEY = os.environ.get("API_KEY")
     MAX_RETRIES = 3
 
-    # Get our discovery doc and build our service
-    r = requests.get(
-        f"https://cloudsupport.googleapis.com/$discovery/rest?key={API_KEY}&labels=V2_TRUSTED_TESTER&version=v2beta",
-        timeout=5)
-    r.raise_for_status()
-    support_service = build_from_document(r.json())
+    support_service = SUPPORT_SVC
 
     client = slack.WebClient(token=os.environ.get("SLACK_TOKEN"))
     client.chat_postEphemeral(channel=channel_id,